@@ -2,135 +2,272 @@
 End-to-end test for all Filofax app pages.
 Tests that pages load and display correct content from the tRPC API.
 """
-from playwright.sync_api import sync_playwright
-import time
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError, async_playwright
+import asyncio
+import collections
+import functools
+import json
+import os
+import tempfile
 
 BASE_URL = "http://localhost:3333"
+# Upper bound for element waits (the context default) and the sign-in URL wait (passed explicitly)
+TIMEOUT_MS = 15000
+# Upper bound for page.goto; kept at Playwright's default because `next dev` compiles
+# each route on first hit, often several at once when pages load in parallel
+NAVIGATION_TIMEOUT_MS = 30000
+# Number of pages checked at once; set E2E_WORKERS=1 to run them one by one
+WORKERS = int(os.environ.get("E2E_WORKERS", os.cpu_count() or 4))
+if WORKERS < 1:
+    raise ValueError(f"Invalid E2E_WORKERS {WORKERS}: expected an integer >= 1")
+# "i/N" runs only the i-th of N interleaved slices of the page list
+SHARD = os.environ.get("E2E_SHARD", "1/1")
+# HEADED=1 shows the browser window for debugging
+HEADLESS = os.environ.get("HEADED") != "1"
+LAUNCH_ARGS = ["--disable-gpu", "--no-sandbox", "--disable-dev-shm-usage"]
+# PW_SHOTS=1 captures a viewport JPEG of every page; failing pages are always captured full-page
+SCREENSHOTS = bool(os.environ.get("PW_SHOTS"))
+# ws:// endpoint of an already running browser server (`npx playwright run-server`);
+# connecting to it skips launching a fresh Chromium for every run
+WS_ENDPOINT = os.environ.get("PW_WS_ENDPOINT")
+# Nothing asserts on pixels, so these are aborted unless screenshots are wanted
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media"})
+# Signed-in storage state, reused across runs until the session expires
+AUTH_STATE = os.environ.get("E2E_AUTH_STATE", os.path.join(tempfile.gettempdir(), "filofax-e2e-auth.json"))
+# Full per-check results, page errors and failed requests, written once at the end of a run;
+# defaults to report.json in the per-run output directory
+REPORT_PATH = os.environ.get("E2E_REPORT")
+
+# (name, path, checks); each check is (label, selector, text)
+PAGES = (
+    # /dashboard redirects to the Daily Planner, so that is the heading it must show
+    ("Dashboard", "/dashboard", (("Dashboard", "h1", "Daily Planner"),)),
+    ("Tasks page", "/dashboard/tasks", (
+        ("Tasks Page", "h1", "Tasks"),
+        ("Tasks Filter Button", "button", "Filter"),
+        ("Tasks Category Button", "button", "Category"),
+    )),
+    ("Habits page", "/dashboard/habits", (("Habits Page", "h1", "Habits"),)),
+    ("Ideas page", "/dashboard/ideas", (("Ideas Page", "h1", "Ideas"),)),
+    ("Memos page", "/dashboard/memos", (("Memos Page", "h1", "Memos"),)),
+    ("Weekly Tasks page", "/dashboard/weekly", (("Weekly Tasks Page", "h1", "Weekly Tasks"),)),
+    ("Monthly Tasks page", "/dashboard/monthly", (("Monthly Tasks Page", "h1", "Monthly Tasks"),)),
+    ("Weekly Planner page", "/dashboard/planner/weekly", (("Weekly Planner Page", "h1", "Weekly Planner"),)),
+    ("Monthly Planner page", "/dashboard/planner/monthly", (("Monthly Planner Page", "h1", "Monthly Planner"),)),
+)
+
+# Resolves every (selector, text) probe for a page in one driver round-trip.
+# Matching mirrors Playwright's `text=`: case-insensitive substring of rendered text.
+PROBE_JS = """probes => probes.map(([selector, text]) =>
+    Array.from(document.querySelectorAll(selector)).some(
+        el => el.innerText.toLowerCase().includes(text.toLowerCase())))"""
+
+
+def shard(items, spec):
+    """Return the slice of items selected by an "i/N" shard spec (1-based)."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        index = count = 0
+    if not 1 <= index <= count:
+        raise ValueError(f"Invalid shard {spec!r}: expected i/N with 1 <= i <= N")
+    # Every shard must check something, or an empty CI job would pass vacuously
+    if count > len(items):
+        raise ValueError(f"Invalid shard {spec!r}: N must not exceed the {len(items)} pages")
+    return items[index - 1::count]
+
+
+@functools.cache
+def run_dir():
+    """Per-run output directory for screenshots and the report, created on first use so parallel runs never collide."""
+    return tempfile.mkdtemp(prefix="filofax-e2e-")
+
+
+async def save_screenshot(page, name, full_page=False):
+    path = os.path.join(run_dir(), name.lower().replace(" ", "-") + ".jpg")
+    await page.screenshot(path=path, full_page=full_page, type="jpeg", quality=60)
+    print(f"  {name} screenshot: {path}")
+
+
+async def block_assets(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+def record_failed_request(failed_requests, request):
+    # Requests aborted by block_assets are expected, not failures
+    if SCREENSHOTS or request.resource_type not in BLOCKED_RESOURCE_TYPES:
+        failed_requests.append(request.url)
+
+
+async def goto(page, path, ready_selector="h1"):
+    """Navigate without waiting for network idle, then wait for ready_selector to render."""
+    await page.goto(f"{BASE_URL}{path}", wait_until="domcontentloaded")
+    if ready_selector is None:
+        return
+    # If it never appears the caller's checks simply record failures
+    try:
+        await page.wait_for_selector(ready_selector, state="visible")
+    except PlaywrightTimeoutError:
+        pass
+
+
+async def probe_auth(context):
+    """Return (dev_auth_bypass, signed_in), fetching both auth endpoints concurrently."""
+    dev_check, session = await asyncio.gather(
+        context.request.get(f"{BASE_URL}/api/auth/dev-check"),
+        context.request.get(f"{BASE_URL}/api/auth/session"),
+    )
+    dev_auth_bypass = dev_check.ok and bool((await dev_check.json()).get("devAuthBypass"))
+    signed_in = session.ok and bool((await session.json() or {}).get("user"))
+    return dev_auth_bypass, signed_in
+
+
+async def sign_in(context):
+    """Sign in with dev credentials and save the resulting session to AUTH_STATE."""
+    page = await context.new_page()
+    # With DEV_AUTH_BYPASS the login page starts the dev auto-login itself, before
+    # rendering anything to wait for; it has no credentials form to fill in
+    await goto(page, "/auth/login", ready_selector=None)
+
+    try:
+        # wait_for_url defaults to the navigation timeout, so bound it explicitly
+        await page.wait_for_url("**/dashboard**", timeout=TIMEOUT_MS)
+    except PlaywrightTimeoutError:
+        print("  Sign in did not reach /dashboard")
+
+    print(f"After sign in, URL: {page.url}")
+    save_auth_state(await context.storage_state())
+    await page.close()
+
+
+def save_auth_state(state):
+    """Atomically replace AUTH_STATE, so concurrent runs never leave a torn file behind."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(AUTH_STATE)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, AUTH_STATE)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+async def new_context(browser):
+    """Create a context from the saved AUTH_STATE, or a fresh one if it is missing or unreadable."""
+    if os.path.exists(AUTH_STATE):
+        try:
+            return await browser.new_context(storage_state=AUTH_STATE)
+        except (PlaywrightError, OSError, ValueError) as error:
+            print(f"  Ignoring unreadable saved session {AUTH_STATE}: {error}")
+    return await browser.new_context()
+
+
+async def check_page(context, workers, name, path, checks):
+    """Open path in a new tab and return a (label, passed) result for each (label, selector, text) check."""
+    async with workers:
+        return await _check_page(context, name, path, checks)
+
+
+async def _check_page(context, name, path, checks):
+    page = await context.new_page()
+    try:
+        try:
+            # Every dashboard page renders an h1 once the client bundle has hydrated
+            await goto(page, path)
+            found = await page.evaluate(PROBE_JS, [[selector, text] for _, selector, text in checks])
+        except PlaywrightError as error:
+            # A page that fails to load fails its own checks without sinking the others
+            reason = str(error).split("\n", 1)[0]
+            print(f"  {name} failed to load: {reason}")
+            return [(label, False) for label, _, _ in checks]
+        results = [(label, passed) for (label, _, _), passed in zip(checks, found)]
+
+        # Diagnostics are best effort; the results above stand even if they fail
+        try:
+            if not all(passed for _, passed in results):
+                # One query yields both presence and text of the heading actually rendered
+                h1_texts = await page.get_by_role("heading", level=1).all_inner_texts()
+                print(f"  {name} H1 text: {h1_texts[0] if h1_texts else 'No H1'}")
+                await save_screenshot(page, name, full_page=True)
+            elif SCREENSHOTS:
+                await save_screenshot(page, name)
+        except (PlaywrightError, OSError) as error:
+            reason = str(error).split("\n", 1)[0]
+            print(f"  {name} diagnostics failed: {reason}")
+
+        return results
+    finally:
+        await page.close()
+
+
+async def test_all_pages():
+    # Resolved before launching anything so a bad E2E_SHARD fails fast
+    pages_to_test = shard(PAGES, SHARD)
+    async with async_playwright() as p:
+        if WS_ENDPOINT:
+            browser = await p.chromium.connect(WS_ENDPOINT)
+        else:
+            browser = await p.chromium.launch(headless=HEADLESS, args=LAUNCH_ARGS)
+        context = await new_context(browser)
+        context.set_default_timeout(TIMEOUT_MS)
+        context.set_default_navigation_timeout(NAVIGATION_TIMEOUT_MS)
+        if not SCREENSHOTS:
+            await context.route("**/*", block_assets)
+
+        # Appended from event callbacks of every tab
+        page_errors = collections.deque()
+        failed_requests = collections.deque()
+
+        # Context-level listeners cover every tab opened below. Only uncaught page
+        # errors cross into Python; console chatter never leaves the browser.
+        context.on("weberror", lambda web_error: page_errors.append(str(web_error.error)))
+        context.on("requestfailed", lambda req: record_failed_request(failed_requests, req))
+
+        dev_auth_bypass, signed_in = await probe_auth(context)
+        if signed_in:
+            print(f"Reusing saved session from {AUTH_STATE}")
+        else:
+            if not dev_auth_bypass:
+                print("  DEV_AUTH_BYPASS is not enabled on the server; dev sign in will likely fail")
+            print("Signing in with dev credentials...")
+            await sign_in(context)
+
+        # Tabs share the signed-in context, so checks run in parallel up to WORKERS at a time
+        print(f"Testing {len(pages_to_test)} pages with {WORKERS} workers...")
+        workers = asyncio.Semaphore(WORKERS)
+        page_results = await asyncio.gather(*(
+            check_page(context, workers, name, path, checks)
+            for name, path, checks in pages_to_test
+        ))
+        results = [result for page_result in page_results for result in page_result]
 
-def test_all_pages():
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
-
-        results = []
-
-        # First, sign in with dev credentials
-        print("Signing in with dev credentials...")
-        page.goto(f"{BASE_URL}/auth/login")
-        page.wait_for_load_state('networkidle')
-
-        # Try to find and fill in the dev login form
-        email_input = page.locator("input[type='email'], input[name='email']").first
-        if email_input.count() > 0:
-            email_input.fill("dev@localhost")
-            # Look for sign in button
-            sign_in_btn = page.locator("button:has-text('Sign')").first
-            if sign_in_btn.count() > 0:
-                sign_in_btn.click()
-                page.wait_for_load_state('networkidle')
-                time.sleep(2)
-
-        print(f"After sign in, URL: {page.url}")
-
-        # Test Dashboard
-        print("Testing Dashboard...")
-        page.goto(f"{BASE_URL}/dashboard")
-        page.wait_for_load_state('networkidle')
-        has_dashboard_title = page.locator("text=Dashboard").count() > 0
-        results.append(("Dashboard", has_dashboard_title))
-        print(f"  Dashboard: {'PASS' if has_dashboard_title else 'FAIL'}")
-
-        # Test Tasks page
-        print("Testing Tasks page...")
-        page.goto(f"{BASE_URL}/dashboard/tasks")
-        page.wait_for_load_state('networkidle')
-        has_tasks_title = page.locator("text=Tasks").first.count() > 0
-        has_filter_button = page.locator("button:has-text('Filter')").count() > 0
-        has_category_button = page.locator("button:has-text('Category')").count() > 0
-        results.append(("Tasks Page", has_tasks_title))
-        results.append(("Tasks Filter Button", has_filter_button))
-        results.append(("Tasks Category Button", has_category_button))
-        print(f"  Tasks Page: {'PASS' if has_tasks_title else 'FAIL'}")
-        print(f"  Filter Button: {'PASS' if has_filter_button else 'FAIL'}")
-        print(f"  Category Button: {'PASS' if has_category_button else 'FAIL'}")
-
-        # Test Habits page
-        print("Testing Habits page...")
-        page.goto(f"{BASE_URL}/dashboard/habits")
-        page.wait_for_load_state('networkidle')
-        has_habits_title = page.locator("text=Habits").first.count() > 0
-        results.append(("Habits Page", has_habits_title))
-        print(f"  Habits Page: {'PASS' if has_habits_title else 'FAIL'}")
-
-        # Test Ideas page
-        print("Testing Ideas page...")
-        page.goto(f"{BASE_URL}/dashboard/ideas")
-        page.wait_for_load_state('networkidle')
-        has_ideas_title = page.locator("text=Ideas").first.count() > 0
-        results.append(("Ideas Page", has_ideas_title))
-        print(f"  Ideas Page: {'PASS' if has_ideas_title else 'FAIL'}")
-
-        # Test Memos page
-        print("Testing Memos page...")
-        page.goto(f"{BASE_URL}/dashboard/memos")
-        page.wait_for_load_state('networkidle')
-        has_memos_title = page.locator("text=Memos").first.count() > 0
-        results.append(("Memos Page", has_memos_title))
-        print(f"  Memos Page: {'PASS' if has_memos_title else 'FAIL'}")
-
-        # Test Weekly Tasks page
-        print("Testing Weekly Tasks page...")
-        page.goto(f"{BASE_URL}/dashboard/weekly")
-        page.wait_for_load_state('networkidle')
-        has_weekly_title = page.locator("text=Weekly Tasks").count() > 0
-        results.append(("Weekly Tasks Page", has_weekly_title))
-        print(f"  Weekly Tasks Page: {'PASS' if has_weekly_title else 'FAIL'}")
-
-        # Test Monthly Tasks page
-        print("Testing Monthly Tasks page...")
-        page.goto(f"{BASE_URL}/dashboard/monthly")
-        page.wait_for_load_state('networkidle')
-        has_monthly_title = page.locator("text=Monthly Tasks").count() > 0
-        results.append(("Monthly Tasks Page", has_monthly_title))
-        print(f"  Monthly Tasks Page: {'PASS' if has_monthly_title else 'FAIL'}")
-
-        # Test Weekly Planner page
-        print("Testing Weekly Planner page...")
-        page.goto(f"{BASE_URL}/dashboard/planner/weekly")
-        page.wait_for_load_state('networkidle')
-        has_weekly_planner = page.locator("text=Weekly Planner").count() > 0
-        results.append(("Weekly Planner Page", has_weekly_planner))
-        print(f"  Weekly Planner Page: {'PASS' if has_weekly_planner else 'FAIL'}")
-
-        # Test Monthly Planner page
-        print("Testing Monthly Planner page...")
-        page.goto(f"{BASE_URL}/dashboard/planner/monthly")
-        page.wait_for_load_state('networkidle')
-        page.screenshot(path="/tmp/monthly-planner-test.png")
-        has_monthly_planner = page.locator("text=Monthly Planner").count() > 0
-        body_text = page.locator("body").inner_text()
-        h1_text = page.locator("h1").first.inner_text() if page.locator("h1").count() > 0 else "No H1"
-        print(f"  H1 text: {h1_text}")
-        print(f"  Body contains 'Monthly Planner': {'Monthly Planner' in body_text}")
-        results.append(("Monthly Planner Page", has_monthly_planner))
-        print(f"  Monthly Planner Page: {'PASS' if has_monthly_planner else 'FAIL'}")
-
-        # Summary
-        print("\n" + "="*50)
-        print("TEST SUMMARY")
-        print("="*50)
         passed = sum(1 for _, r in results if r)
         total = len(results)
-        print(f"Passed: {passed}/{total}")
-        for name, result in results:
-            status = "✓ PASS" if result else "✗ FAIL"
-            print(f"  {status}: {name}")
+        report = {
+            "summary": {"passed": passed, "total": total},
+            "results": [{"name": name, "passed": result} for name, result in results],
+            "page_errors": list(page_errors),
+            "failed_requests": list(failed_requests),
+        }
+        report_path = REPORT_PATH or os.path.join(run_dir(), "report.json")
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+        failures = [name for name, result in results if not result]
+        print(
+            f"Passed: {passed}/{total}, page errors: {len(page_errors)}, "
+            f"failed requests: {len(failed_requests)}"
+            + (f", failing: {', '.join(failures)}" if failures else "")
+            + f" (report: {report_path})"
+        )
 
-        browser.close()
+        await browser.close()
 
         return passed == total
 
 if __name__ == "__main__":
-    success = test_all_pages()
+    success = asyncio.run(test_all_pages())
     exit(0 if success else 1)